@@ -1,6 +1,6 @@
 import streamlit as st
-import requests
-import base64
+import httpx
+import pybase64
 from PIL import Image
 import io
 
@@ -14,13 +14,30 @@ st.set_page_config(
 # --- 2. Backend API Definition ---
 BACKEND_URL = "http://127.0.0.1:8000"
 
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """Build one pooled keep-alive client that survives Streamlit reruns, so requests reuse warm connections to the backend."""
+    return httpx.Client(
+        base_url=BACKEND_URL,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=600,
+    )
+
+CLIENT = get_http_client()
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def _decode_b64_image(b64: str) -> Image.Image:
+    """Decode a base64 image once; chat history re-renders on every rerun."""
+    return Image.open(io.BytesIO(pybase64.b64decode(b64)))
+
 # --- 3. API Client Functions ---
+@st.cache_data(ttl=60, show_spinner=False)
 def api_get_indexed_files():
     try:
-        response = requests.get(f"{BACKEND_URL}/indexed_files")
+        response = CLIENT.get("/indexed_files")
         response.raise_for_status()
         return response.json().get("files", [])
-    except requests.exceptions.RequestException:
+    except httpx.HTTPError:
         st.sidebar.error("Connection to backend failed. Please ensure the backend service is running.")
         return []
 
@@ -29,13 +46,9 @@ def api_upload_file(uploaded_file):
     try:
         with st.status(f"Processing '{uploaded_file.name}'...") as status:
             status.update(label="Uploading file...")
-            response = requests.post(f"{BACKEND_URL}/upload", files=files, timeout=600)
+            response = CLIENT.post("/upload", files=files, timeout=600)
             response.raise_for_status()
             result = response.json()
-            
-            status.update(label="Analyzing and indexing content...")
-            import time
-            time.sleep(2)
 
             if result.get("status") == "exists":
                 status.update(label=f"File '{result['filename']}' already exists!", state="complete")
@@ -44,7 +57,7 @@ def api_upload_file(uploaded_file):
                 status.update(label="Processing complete!", state="complete")
                 st.toast(f"✅ File '{result['filename']}' was added successfully!")
         return result
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         st.error(f"File upload failed: {e}")
         return None
 
@@ -55,23 +68,23 @@ def api_ask_question(question: str, image_file=None):
         files['file'] = (image_file.name, image_file.getvalue(), image_file.type)
     
     try:
-        response = requests.post(f"{BACKEND_URL}/query", data=data, files=files if image_file else None, timeout=600)
+        response = CLIENT.post("/query", data=data, files=files if image_file else None, timeout=600)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         st.error(f"Query failed: {e}")
         return None
 
 def api_clear_db():
     try:
         with st.spinner("Clearing knowledge base..."):
-            response = requests.post(f"{BACKEND_URL}/clear_all")
+            response = CLIENT.post("/clear_all")
             response.raise_for_status()
         st.toast("💥 Knowledge base cleared successfully!")
         st.sidebar.success("Knowledge base has been cleared on the backend.")
         st.sidebar.warning("Please restart the backend server to ensure all connections are reset before uploading new documents.")
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         st.error(f"Failed to clear knowledge base: {e}")
         return None
 
@@ -95,6 +108,7 @@ def handle_knowledge_upload():
     if st.session_state.knowledge_uploader is not None:
         uploaded_file = st.session_state.knowledge_uploader
         api_upload_file(uploaded_file)
+        api_get_indexed_files.clear()  # the list just changed, drop the cached copy
         st.session_state.indexed_files = api_get_indexed_files()
 
 def handle_send_message():
@@ -133,7 +147,7 @@ def handle_clear_db():
     """
     try:
         st.toast("Sending request to clear knowledge base...")
-        response = requests.post(f"{BACKEND_URL}/clear_all")
+        response = CLIENT.post("/clear_all")
         
         # Success Case: The backend somehow managed to delete the files
         if response.status_code == 200:
@@ -149,10 +163,11 @@ def handle_clear_db():
             # Other HTTP errors
             response.raise_for_status()
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         st.error(f"Failed to send 'clear' request to backend: {e}")
 
     # Reset frontend state regardless of backend outcome
+    api_get_indexed_files.clear()
     st.session_state.indexed_files = []
     st.session_state.chat_history = []
 
@@ -188,8 +203,7 @@ with chat_container:
     for message in st.session_state.chat_history:
         with st.chat_message(message["role"]):
             if message["role"] == "user" and "query_image_b64" in message:
-                img_data = base64.b64decode(message["query_image_b64"])
-                img = Image.open(io.BytesIO(img_data))
+                img = _decode_b64_image(message["query_image_b64"])
                 st.image(img, caption=message.get("query_image_name", "Uploaded image"), width=180)
             st.markdown(message["content"])
             if message["role"] == "assistant" and "sources" in message and message["sources"]:
@@ -198,8 +212,7 @@ with chat_container:
                         st.markdown(f"**File:** `{source.get('source', 'N/A')}` | **Page:** `{source.get('page', 'N/A')}`")
                         if source.get('type') == 'image' and source.get('image_b64'):
                             try:
-                                img_data = base64.b64decode(source['image_b64'])
-                                img = Image.open(io.BytesIO(img_data))
+                                img = _decode_b64_image(source['image_b64'])
                                 col1, col2 = st.columns([1, 2])
                                 with col1:
                                     st.image(img, use_column_width=True)
@@ -232,7 +245,7 @@ if send_btn and (prompt or query_image_file):
         user_message = {"role": "user", "content": prompt}
         if query_image_file:
             image_bytes = query_image_file.getvalue()
-            image_b64 = base64.b64encode(image_bytes).decode('utf-8')
+            image_b64 = pybase64.b64encode(image_bytes).decode('utf-8')
             user_message["query_image_b64"] = image_b64
             user_message["query_image_name"] = query_image_file.name
         st.session_state.chat_history.append(user_message)
@@ -253,8 +266,7 @@ if send_btn and (prompt or query_image_file):
                                 st.markdown(f"**Source:** `{source.get('source', 'N/A')}` | **Page:** `{source.get('page', 'N/A')}`")
                                 if source.get('type') == 'image' and source.get('image_b64'):
                                     try:
-                                        img_data = base64.b64decode(source['image_b64'])
-                                        img = Image.open(io.BytesIO(img_data))
+                                        img = _decode_b64_image(source['image_b64'])
                                         st.image(img, caption=f"Source image (Page: {source.get('page')})", use_column_width=True)
                                     except Exception as e:
                                         st.warning(f"Cannot display source image: {e}")
@@ -1,9 +1,13 @@
+import gc
+import hashlib
 import os
-import shutil
+import aiofiles
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse 
+from fastapi.responses import ORJSONResponse
 from typing import Optional
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+import anyio.to_thread
 import uvicorn
 
 from document_processor import process_document
@@ -13,11 +17,20 @@ import rag_chain
 app = FastAPI(
     title="Multimodal RAG Backend API",
     description="API for processing documents, managing a vector store, and answering questions.",
+    default_response_class=ORJSONResponse,
 )
 
 UPLOAD_DIR = "temp_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB per read keeps buffering bounded for large PDFs
+
+@app.on_event("startup")
+async def configure_threadpool():
+    # Document processing and RAG calls are offloaded to this pool; the
+    # default of 40 is shared with other anyio users, so size it explicitly.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 32
+
 @app.post("/upload")
 async def upload_document(file: UploadFile = File(...)):
     """
@@ -25,26 +38,36 @@ async def upload_document(file: UploadFile = File(...)):
     """
     file_path = os.path.join(UPLOAD_DIR, file.filename)
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        if vector_store.document_exists(file.filename):
-            return JSONResponse(
-                status_code=200,
-                content={"status": "exists", "filename": file.filename, "message": "Document already exists in the knowledge base."}
-            )
-        processed_data = process_document(file_path)
+        # Hash the upload while it is still in the spool so duplicates are
+        # rejected before any bytes hit the disk.
+        hasher = hashlib.blake2b()
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+        content_hash = hasher.hexdigest()
+        if await run_in_threadpool(vector_store.document_exists_by_hash, content_hash) \
+                or await run_in_threadpool(vector_store.document_exists, file.filename):
+            return {"status": "exists", "filename": file.filename, "message": "Document already exists in the knowledge base."}
+        await file.seek(0)
+        # Write to a .part file and publish it atomically so a crash mid-copy
+        # never leaves a half-written document at the final path.
+        async with aiofiles.open(file_path + ".part", "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await buffer.write(chunk)
+        os.replace(file_path + ".part", file_path)
+        gc.collect()  # release spooled upload buffers before the heavy processing below
+        processed_data = await run_in_threadpool(process_document, file_path)
         if not processed_data:
             raise HTTPException(status_code=400, detail="Failed to process the document or document is empty.")
-        vector_store.add_to_knowledge_base(processed_data)
-        return JSONResponse(
-            status_code=200,
-            content={"status": "success", "filename": file.filename, "message": "Document processed and added successfully."}
-        )
+        await run_in_threadpool(vector_store.add_to_knowledge_base, processed_data, content_hash)
+        return {"status": "success", "filename": file.filename, "message": "Document processed and added successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        for leftover in (file_path, file_path + ".part"):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
 
 class QueryRequest(BaseModel):
     question: str
@@ -59,8 +82,8 @@ async def query_rag(
     if not question:
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
     try:
-        response = rag_chain.rag_chain_with_source_retrieval(question)
-        return JSONResponse(status_code=200, content=response)
+        response = await run_in_threadpool(rag_chain.rag_chain_with_source_retrieval, question)
+        return response
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -72,8 +95,9 @@ async def get_indexed_files():
     Get the list of all indexed files in the knowledge base.
     """
     try:
-        files = vector_store.get_indexed_files()
-        return JSONResponse(status_code=200, content={"files": files})
+        files = await run_in_threadpool(vector_store.get_indexed_files)
+        # Let the HTTP layer coalesce the sidebar's frequent polls.
+        return ORJSONResponse(status_code=200, content={"files": files}, headers={"Cache-Control": "max-age=5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving file list: {str(e)}")
 
@@ -83,10 +107,21 @@ async def clear_knowledge_base_state():
     Clears the in-memory state of the knowledge base. The client is responsible for guiding the user to restart the server and manually delete files for a full reset.
     """
     try:
-        vector_store.clear_knowledge_base()
+        await run_in_threadpool(vector_store.clear_knowledge_base)
         return {"status": "success", "message": "In-memory state cleared. Awaiting server restart for full reset."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred during state reset: {str(e)}")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Single worker: the FAISS index, indexed-file cache and QA cache are
+    # mutable per-process singletons, so extra workers would serve stale
+    # state and lose concurrent writes. uvloop + httptools and the sized
+    # threadpool carry the concurrency instead.
+    uvicorn.run(
+        "backend_server:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=1,
+    )
\ No newline at end of file
@@ -1,17 +1,36 @@
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_unstructured import UnstructuredLoader
 import fitz  # PyMuPDF for PDF processing
 from PIL import Image
 import io
-from typing import List, Dict, Any
+from typing import Any, Dict, List, Tuple
 
-def process_document(file_path: str) -> List[Dict[str, Any]]:
+# Category → markdown formatter, looked up once per element instead of
+# walking an if/elif chain for every chunk of a large document.
+_FORMATTERS = {
+    "Title": lambda content: f"# {content}",
+    "Header": lambda content: f"## {content}",
+    "SubTitle": lambda content: f"## {content}",
+    "ListItem": lambda content: f"* {content}",
+    "Table": lambda content: f"\n{content}\n",
+}
+
+def _pixmap_to_image(pix: fitz.Pixmap) -> Image.Image:
     """
-    Extracts text, tables, formulas, and images from a document using Unstructured and PyMuPDF.
-    Returns a list of content chunks with type, content, page, and source info.
+    Wrap a pixmap's raw samples in a PIL image directly, skipping the
+    PNG encode/decode round-trip of pix.tobytes("png") + Image.open.
     """
-    print(f"--- Processing document: {os.path.basename(file_path)} ---")
+    mode = "RGB" if pix.n < 4 else "RGBA"
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
 
+def _run_unstructured(file_path: str) -> Tuple[List[Dict[str, Any]], List[Tuple[int, Any]]]:
+    """
+    Run the Unstructured pass in a single sweep over the elements, extracting
+    text/table chunks and, for non-PDF files, embedded images (PDF images are
+    handled by the PyMuPDF pass). Formula bboxes are returned separately so
+    they can be clipped once the PDF document is open.
+    """
     loader = UnstructuredLoader(
         file_path=file_path,
         strategy="hi_res",
@@ -20,40 +39,41 @@ def process_document(file_path: str) -> List[Dict[str, Any]]:
         languages=["chi_sim", "eng"],
     )
 
+    is_pdf = file_path.lower().endswith('.pdf')
     results = []
+    formula_clips = []
     try:
         elements = loader.load()
         for element in elements:
-            if element.metadata.get('category') != "Image":
+            element_type = element.metadata.get('category', 'Unknown')
+            if element_type == "Image":
+                if not is_pdf:
+                    image_bytes = element.metadata.get('image_bytes')
+                    if image_bytes:
+                        try:
+                            pil_image = Image.open(io.BytesIO(image_bytes))
+                            results.append({
+                                "type": "image",
+                                "content": pil_image,
+                                "page": element.metadata.get('page_number', 1),
+                                "source": os.path.basename(file_path)
+                            })
+                        except:
+                            pass
+            else:
                 content = element.page_content
                 if content.strip():
-                    element_type = element.metadata.get('category', 'Unknown')
-                    if element_type == "Title":
-                        formatted_content = f"# {content}"
-                    elif element_type in ["Header", "SubTitle"]:
-                        formatted_content = f"## {content}"
-                    elif element_type == "ListItem":
-                        formatted_content = f"* {content}"
-                    elif element_type == "Table":
-                        formatted_content = f"\n{content}\n"
-                    elif element_type == "Formula":
+                    if element_type == "Formula":
                         bbox = element.metadata.get('bbox')
-                        if bbox:
-                            try:
-                                page = pdf_doc.load_page(page_num - 1)
-                                clip_rect = fitz.Rect(bbox)
-                                pix = page.get_pixmap(clip=clip_rect, dpi=150)
-                                pil_image = Image.open(io.BytesIO(pix.tobytes("png")))
-                                results.append({
-                                    "type": "image_formula",
-                                    "content": pil_image,
-                                    "page": element.metadata.get('page_number', 1),
-                                    "source": os.path.basename(file_path)
-                                })
-                            except Exception as e:
-                                print(f"WARNING: Could not clip formula image. Error: {e}")
-                    else:
+                        if bbox and is_pdf:
+                            # The document is not open here; remember the clip
+                            # and render it in the PDF pass.
+                            formula_clips.append((element.metadata.get('page_number', 1), bbox))
+                            continue
                         formatted_content = content
+                    else:
+                        formatter = _FORMATTERS.get(element_type)
+                        formatted_content = formatter(content) if formatter else content
                     results.append({
                         "type": "text",
                         "content": formatted_content,
@@ -62,56 +82,121 @@ def process_document(file_path: str) -> List[Dict[str, Any]]:
                     })
     except Exception as e:
         print(f"An error occurred during Unstructured processing: {e}")
+    return results, formula_clips
 
-    is_pdf = file_path.lower().endswith('.pdf')
-    if is_pdf:
-        try:
-            pdf_doc = fitz.open(file_path)
-            print("Processing PDF for images and scanned pages...")
-            for page_num in range(len(pdf_doc)):
-                page = pdf_doc.load_page(page_num)
-                embedded_images = page.get_images(full=True)
-                if embedded_images:
-                    for _, img in enumerate(embedded_images):
-                        xref = img[0]
-                        base_image = pdf_doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        pil_image = Image.open(io.BytesIO(image_bytes))
-                        results.append({
-                            "type": "image",
-                            "content": pil_image,
-                            "page": page_num + 1,
-                            "source": os.path.basename(file_path)
-                        })
-                else:
-                    pix = page.get_pixmap(dpi=150)
-                    pil_image = Image.open(io.BytesIO(pix.tobytes("png")))
+def _clip_formulas(pdf_path: str, formula_clips: List[Tuple[int, Any]]) -> List[Dict[str, Any]]:
+    """
+    Render the formula regions recorded by the Unstructured pass, sharing one
+    open document for all clips.
+    """
+    results = []
+    if not formula_clips:
+        return results
+    try:
+        with fitz.open(pdf_path) as pdf_doc:
+            for page_number, bbox in formula_clips:
+                try:
+                    page = pdf_doc.load_page(page_number - 1)
+                    pix = page.get_pixmap(clip=fitz.Rect(bbox), dpi=150)
                     results.append({
-                        "type": "image",
-                        "content": pil_image,
-                        "page": page_num + 1,
-                        "source": os.path.basename(file_path)
+                        "type": "image_formula",
+                        "content": _pixmap_to_image(pix),
+                        "page": page_number,
+                        "source": os.path.basename(pdf_path)
                     })
-            pdf_doc.close()
-        except Exception as e:
-            print(f"An error occurred during PDF image processing: {e}")
-    else:
-        print("Processing non-PDF file for images from Unstructured metadata...")
-        if 'elements' in locals():
-            for element in elements:
-                if element.metadata.get('category') == "Image":
-                    image_bytes = element.metadata.get('image_bytes')
-                    if image_bytes:
-                        try:
-                            pil_image = Image.open(io.BytesIO(image_bytes))
-                            results.append({
-                                "type": "image",
-                                "content": pil_image,
-                                "page": element.metadata.get('page_number', 1),
-                                "source": os.path.basename(file_path)
-                            })
-                        except:
-                            pass
+                except Exception as e:
+                    print(f"WARNING: Could not clip formula image. Error: {e}")
+    except Exception as e:
+        print(f"An error occurred during formula clipping: {e}")
+    return results
+
+def _process_page(pdf_path: str, page_num: int) -> List[Dict[str, Any]]:
+    """
+    Extract the images of a single PDF page. Opens its own Document because
+    fitz documents are not safe to share across threads.
+    """
+    results = []
+    pdf_doc = fitz.open(pdf_path)
+    try:
+        page = pdf_doc.load_page(page_num)
+        embedded_images = page.get_images(full=True)
+        if embedded_images:
+            for _, img in enumerate(embedded_images):
+                xref = img[0]
+                base_image = pdf_doc.extract_image(xref)
+                image_bytes = base_image["image"]
+                pil_image = Image.open(io.BytesIO(image_bytes))
+                results.append({
+                    "type": "image",
+                    "content": pil_image,
+                    "page": page_num + 1,
+                    "source": os.path.basename(pdf_path)
+                })
+        elif not page.get_text("text").strip():
+            # Only rasterize true scanned pages; pages with a text layer are
+            # already covered by the Unstructured pass.
+            pix = page.get_pixmap(dpi=150)
+            pil_image = _pixmap_to_image(pix)
+            results.append({
+                "type": "image",
+                "content": pil_image,
+                "page": page_num + 1,
+                "source": os.path.basename(pdf_path)
+            })
+    finally:
+        pdf_doc.close()
+    return results
+
+def _extract_pdf_images(file_path: str) -> List[Dict[str, Any]]:
+    """
+    Extract embedded images from a PDF with PyMuPDF, rasterizing pages that
+    carry no embedded images (scanned pages). Pages are fanned out across a
+    thread pool since get_pixmap/extract_image release the GIL.
+    """
+    try:
+        with fitz.open(file_path) as pdf_doc:
+            page_count = len(pdf_doc)
+    except Exception as e:
+        print(f"An error occurred during PDF image processing: {e}")
+        return []
+
+    print("Processing PDF for images and scanned pages...")
+    page_results: Dict[int, List[Dict[str, Any]]] = {}
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {
+            executor.submit(_process_page, file_path, page_num): page_num
+            for page_num in range(page_count)
+        }
+        for future in as_completed(futures):
+            page_num = futures[future]
+            try:
+                page_results[page_num] = future.result()
+            except Exception as e:
+                print(f"An error occurred while processing page {page_num + 1}: {e}")
+    results = []
+    for page_num in sorted(page_results):
+        results.extend(page_results[page_num])
+    return results
+
+def process_document(file_path: str) -> List[Dict[str, Any]]:
+    """
+    Extracts text, tables, formulas, and images from a document using Unstructured and PyMuPDF.
+    Returns a list of content chunks with type, content, page, and source info.
+    """
+    print(f"--- Processing document: {os.path.basename(file_path)} ---")
+
+    is_pdf = file_path.lower().endswith('.pdf')
+    # The Unstructured pass and the PyMuPDF image pass are independent and
+    # both GIL-releasing, so run them side by side.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        unstructured_future = executor.submit(_run_unstructured, file_path)
+        pdf_images_future = executor.submit(_extract_pdf_images, file_path) if is_pdf else None
+        results, formula_clips = unstructured_future.result()
+        if pdf_images_future is not None:
+            results.extend(pdf_images_future.result())
+    if is_pdf:
+        results.extend(_clip_formulas(file_path, formula_clips))
+
     print(f"--- Document processing finished. Total chunks: {len(results)} ---")
     return results
 
@@ -130,4 +215,4 @@ if __name__ == '__main__':
         image_count = sum(1 for item in processed_data if item['type'] == 'image')
         print(f"\n--- Test Results for {test_file_name} ---")
         print(f"Total extracted chunks: {len(processed_data)}")
-        print(f"Text chunks: {text_count}, Image chunks: {image_count}")
\ No newline at end of file
+        print(f"Text chunks: {text_count}, Image chunks: {image_count}")
@@ -1,19 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
+import hashlib
+import os
+import re
+import shelve
+import numpy as np
+import xxhash
+from numba import njit
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langchain_core.runnables import RunnableLambda
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import ChatOllama
 import ollama
-from vector_store import get_retriever, get_docstore, get_vectorstore
+from vector_store import get_retriever, get_docstore, get_vectorstore, get_embeddings, search_with_scores, STORE_PATH, EMBEDDING_MODEL
+from semantic_cache import get_qa_cache
 
 llm = ChatOllama(model="qwen2.5vl:7b", temperature=0.1)
 citation_llm = ChatOllama(model="qwen2.5vl:7b", temperature=0.0, format="json")
+qa_cache = get_qa_cache()
+
+# Prompt templates and chains are immutable, so build them once at import
+# instead of re-parsing the templates on every query.
+ANSWER_GENERATION_PROMPT = ChatPromptTemplate.from_template(
+    """
+    **Your Role**: You are a document analysis assistant.
+    **Task**: Based ONLY on the "Context Information" below, answer the "User's Question".
+    ---
+    **Context Information**:
+    {context}
+    ---
+    **User's Question**:
+    {question}
+    ---
+    **Your Answer**:
+    """
+)
+ANSWER_CHAIN = ANSWER_GENERATION_PROMPT | llm | StrOutputParser()
+
+CITATION_PROMPT = ChatPromptTemplate.from_template(
+    """
+    You are a highly analytical and skeptical citation-finding assistant. Your ONLY job is to determine which of the provided sources were *actually used* to create the given answer.
+
+    You must follow these STRICT rules:
+    1. Compare the "Generated Answer" against each "Source" provided below.
+    2. Identify ONLY the sources that contain the EXACT information, facts, or data points present in the answer.
+    3. **CRITICAL RULE**: Do NOT cite a source just because it shares some keywords with the answer. The source must SEMANTICALLY support the claims in the answer.
+    4. If the answer makes a specific claim (e.g., "Revenue was $5M"), the source MUST contain that exact fact.
+    5. Be extremely skeptical. It is better to return an empty list than to cite an irrelevant source.
+    6. Respond with a JSON object containing a single key "cited_sources". The value should be a list of the IDs of the relevant sources (e.g., {{{{"cited_sources": ["SOURCE_1", "SOURCE_3"]}}}}).
+    7. If no source directly supports the answer, you MUST return an empty list: {{{{"cited_sources": []}}}}.
+    8. Do not add any explanation or text outside of the JSON object.
+    ---
+    **Generated Answer**:
+    {answer}
+    ---
+    **Available Sources**:
+    {sources}
+    ---
+    **Your JSON Response**:
+    """
+)
+CITATION_CHAIN = CITATION_PROMPT | citation_llm | JsonOutputParser()
+
 print("RAG chain components initialized successfully.")
 
+# Sources whose embedding cosine-similarity with the answer clears this bar
+# are cited without asking an LLM.
+CITATION_SIMILARITY_THRESHOLD = 0.75
+
+# Answers opening with one of these phrases did not use the context, so the
+# citation step can be skipped entirely.
+_REFUSAL_RE = re.compile(
+    r"^(i (cannot|can't|don't)|the (context|sources) (do|does) not|no relevant information)",
+    re.IGNORECASE
+)
+
+def _looks_like_refusal(answer: str) -> bool:
+    return bool(_REFUSAL_RE.match(answer.strip()))
+
+# Adaptive HNSW effort: start cheap and only pay for a high-recall pass when
+# the first pass looks unsure (scores spread out instead of tightly clustered).
+EF_SEARCH_FAST = 32
+EF_SEARCH_THOROUGH = 128
+EF_SCORE_SPREAD_THRESHOLD = 0.05
+
+def _adaptive_similarity_search(query: str, k: int):
+    scored = search_with_scores(query, k, ef_search=EF_SEARCH_FAST)
+    if scored:
+        scores = [score for _, score in scored]
+        if max(scores) - min(scores) < EF_SCORE_SPREAD_THRESHOLD:
+            return [doc for doc, _ in scored]
+    print("Low-effort search looks uncertain; retrying with higher efSearch.")
+    scored = search_with_scores(query, k, ef_search=EF_SEARCH_THOROUGH)
+    return [doc for doc, _ in scored]
+
+@njit(cache=True)
+def _first_seen_mask(hashes):
+    """
+    Boolean mask marking the first occurrence of each hash, compiled to
+    native code so the per-query dedup stage skips the interpreter.
+    """
+    n = hashes.shape[0]
+    keep = np.empty(n, dtype=np.bool_)
+    seen = {}
+    for i in range(n):
+        h = hashes[i]
+        if h in seen:
+            keep[i] = False
+        else:
+            seen[h] = 0
+            keep[i] = True
+    return keep
+
+# Query-image descriptions keyed by content hash: in-memory dict for the hot
+# path, shelve DB for persistence across restarts.
+IMAGE_DESC_CACHE_PATH = os.path.join(STORE_PATH, "image_desc_cache.db")
+_image_desc_cache: Dict[str, str] = {}
+
+def _image_desc_cache_get(image_hash: str) -> Optional[str]:
+    if image_hash in _image_desc_cache:
+        return _image_desc_cache[image_hash]
+    try:
+        with shelve.open(IMAGE_DESC_CACHE_PATH) as db:
+            if image_hash in db:
+                _image_desc_cache[image_hash] = db[image_hash]
+                return _image_desc_cache[image_hash]
+    except Exception as e:
+        print(f"WARNING: Could not read image description cache: {e}")
+    return None
+
+def _image_desc_cache_put(image_hash: str, description: str):
+    _image_desc_cache[image_hash] = description
+    try:
+        os.makedirs(STORE_PATH, exist_ok=True)
+        with shelve.open(IMAGE_DESC_CACHE_PATH) as db:
+            db[image_hash] = description
+    except Exception as e:
+        print(f"WARNING: Could not persist image description cache: {e}")
+
 def analyze_query_image(image_b64: str) -> str:
     """
     Use a multimodal LLM to generate a detailed description for the user's uploaded query image.
+    Identical images (by content hash) skip the VLM entirely.
     """
+    image_hash = hashlib.sha256(image_b64.encode()).hexdigest()
+    cached_description = _image_desc_cache_get(image_hash)
+    if cached_description is not None:
+        print("Query image description served from cache.")
+        return cached_description
     print("Analyzing user's query image...")
     try:
         response = ollama.chat(
@@ -27,14 +161,17 @@ def analyze_query_image(image_b64: str) -> str:
         )
         description = response['message']['content']
         print(f"Query image description generated: {description[:100]}...")
+        _image_desc_cache_put(image_hash, description)
         return description
     except Exception as e:
         print(f"ERROR: Failed to analyze query image: {e}")
         return ""
 
-def rag_chain_with_source_retrieval(input_question: str, query_image_b64: Optional[str] = None) -> Dict[str, Any]:
+def rag_chain_with_source_retrieval(input_question: str, query_image_b64: Optional[str] = None,
+                                    cache_similarity_threshold: Optional[float] = None) -> Dict[str, Any]:
     """
     Orchestrates a RAG process that accepts an optional query image.
+    Semantically repeated queries are answered straight from the QA cache.
     """
     print(f"--- Running RAG chain for question: '{input_question[:50]}...' ---")
     search_query = input_question
@@ -42,16 +179,21 @@ def rag_chain_with_source_retrieval(input_question: str, query_image_b64: Option
         print("Image provided in query. Analyzing image to enhance search query...")
         image_description = analyze_query_image(query_image_b64)
         search_query = f"{input_question}\n\n[Information from uploaded image]:\n{image_description}"
-        
+
+    cached_response = qa_cache.lookup(search_query, similarity_threshold=cache_similarity_threshold)
+    if cached_response is not None:
+        return cached_response
+
     print(f"Step 2: Retrieving documents with enhanced query: '{search_query[:100]}...'")
-    direct_results = get_vectorstore().similarity_search(search_query, k=10)
-    unique_results = []
-    seen_contents = set()
-    for doc in direct_results:
-        content = doc.page_content.strip()
-        if content not in seen_contents:
-            unique_results.append(doc)
-            seen_contents.add(content)
+    # Ingest-time dedup means k=5 already yields distinct passages; the
+    # xxh3 pass below only guards against pre-dedup indexes.
+    direct_results = _adaptive_similarity_search(search_query, k=5)
+    # 64-bit content hashes: cheaper to hash and store than the full chunk text.
+    hashes = np.fromiter(
+        (xxhash.xxh3_64_intdigest(doc.page_content) for doc in direct_results),
+        dtype=np.uint64, count=len(direct_results)
+    )
+    unique_results = [doc for doc, keep in zip(direct_results, _first_seen_mask(hashes)) if keep]
     print(f"Found {len(unique_results)} unique documents.")
     
     if not unique_results:
@@ -64,67 +206,70 @@ def rag_chain_with_source_retrieval(input_question: str, query_image_b64: Option
     
     print("Step 3: Creating prompt for answer generation...")
     full_context_str = "\n\n---\n\n".join([doc.page_content for doc in unique_results])
-    
-    answer_generation_prompt_template = ChatPromptTemplate.from_template(
-        """
-        **Your Role**: You are a document analysis assistant.
-        **Task**: Based ONLY on the "Context Information" below, answer the "User's Question".
-        ---
-        **Context Information**:
-        {context}
-        ---
-        **User's Question**:
-        {question}
-        ---
-        **Your Answer**:
-        """
-    )
-    answer_generation_chain = answer_generation_prompt_template | llm | StrOutputParser()
-    generated_answer = answer_generation_chain.invoke({
-        "context": full_context_str,
-        "question": search_query 
-    })
+
+    def _prepare_citation_inputs():
+        # Everything the citation step needs except the answer itself is
+        # already known, so build it while the answer LLM call is in flight.
+        source_options = [f"<SOURCE_{i+1}>\n{doc.page_content}\n</SOURCE_{i+1}>" for i, doc in enumerate(unique_results)]
+        sources_str = "\n\n".join(source_options)
+        try:
+            source_embeddings = get_embeddings().embed_documents([doc.page_content for doc in unique_results])
+        except Exception as e:
+            print(f"WARNING: Could not pre-embed sources: {e}")
+            source_embeddings = None
+        return sources_str, source_embeddings
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        citation_prep = executor.submit(_prepare_citation_inputs)
+        # Stream the answer instead of blocking on the full generation, so
+        # tokens are available incrementally if the transport ever exposes
+        # them. The model preload keeps the embedding path warm, so the
+        # citation embedding right after the last token is already cheap.
+        answer_parts = []
+        for chunk in ANSWER_CHAIN.stream({
+            "context": full_context_str,
+            "question": search_query
+        }):
+            answer_parts.append(chunk)
+        generated_answer = "".join(answer_parts)
     print(f"Generated Answer: {generated_answer[:100]}...")
-    
+
     print("Step 4: Identifying relevant sources...")
-    source_options = [f"<SOURCE_{i+1}>\n{doc.page_content}\n</SOURCE_{i+1}>" for i, doc in enumerate(unique_results)]
-    all_sources_str = "\n\n".join(source_options)
-    
-    citation_prompt_template = ChatPromptTemplate.from_template(
-    """
-    You are a highly analytical and skeptical citation-finding assistant. Your ONLY job is to determine which of the provided sources were *actually used* to create the given answer.
-    
-    You must follow these STRICT rules:
-    1. Compare the "Generated Answer" against each "Source" provided below.
-    2. Identify ONLY the sources that contain the EXACT information, facts, or data points present in the answer.
-    3. **CRITICAL RULE**: Do NOT cite a source just because it shares some keywords with the answer. The source must SEMANTICALLY support the claims in the answer.
-    4. If the answer makes a specific claim (e.g., "Revenue was $5M"), the source MUST contain that exact fact.
-    5. Be extremely skeptical. It is better to return an empty list than to cite an irrelevant source.
-    6. Respond with a JSON object containing a single key "cited_sources". The value should be a list of the IDs of the relevant sources (e.g., {{{{"cited_sources": ["SOURCE_1", "SOURCE_3"]}}}}).
-    7. If no source directly supports the answer, you MUST return an empty list: {{{{"cited_sources": []}}}}.
-    8. Do not add any explanation or text outside of the JSON object.
-    ---
-    **Generated Answer**:
-    {answer}
-    ---
-    **Available Sources**:
-    {sources}
-    ---
-    **Your JSON Response**:
-    """
-    )
-    citation_chain = citation_prompt_template | citation_llm | JsonOutputParser()
-    
-    try:
-        citation_response = citation_chain.invoke({
-            "answer": generated_answer,
-            "sources": all_sources_str
-        })
-        cited_source_ids = citation_response.get("cited_sources", [])
-    except Exception as e:
-        print(f"ERROR: Failed to get citations from LLM. Returning empty sources. Error: {e}")
-        cited_source_ids = []
-        
+    all_sources_str, source_embeddings = citation_prep.result()
+
+    # Citation by embedding similarity: microseconds of linear algebra
+    # instead of a second full LLM round-trip.
+    cited_source_ids = []
+    if _looks_like_refusal(generated_answer):
+        print("Answer looks like a refusal; skipping the citation step.")
+    elif source_embeddings:
+        try:
+            answer_embedding = np.asarray(get_embeddings().embed_query(generated_answer), dtype="float32")
+            answer_embedding /= max(np.linalg.norm(answer_embedding), 1e-12)
+            source_matrix = np.asarray(source_embeddings, dtype="float32")
+            source_matrix /= np.linalg.norm(source_matrix, axis=1, keepdims=True).clip(min=1e-12)
+            similarities = source_matrix @ answer_embedding
+            cited_source_ids = [
+                f"SOURCE_{i+1}" for i, similarity in enumerate(similarities)
+                if similarity > CITATION_SIMILARITY_THRESHOLD
+            ]
+            print(f"Embedding-similarity citation selected {len(cited_source_ids)} sources.")
+        except Exception as e:
+            print(f"WARNING: Embedding-similarity citation failed: {e}")
+
+    if not cited_source_ids and not _looks_like_refusal(generated_answer):
+        # No source cleared the bar (or embeddings were unavailable); let the
+        # skeptical citation LLM make the call.
+        try:
+            citation_response = CITATION_CHAIN.invoke({
+                "answer": generated_answer,
+                "sources": all_sources_str
+            })
+            cited_source_ids = citation_response.get("cited_sources", [])
+        except Exception as e:
+            print(f"ERROR: Failed to get citations from LLM. Returning empty sources. Error: {e}")
+            cited_source_ids = []
+
     final_sources = []
     for i, doc in enumerate(unique_results):
         source_id = f"SOURCE_{i+1}"
@@ -138,11 +283,31 @@ def rag_chain_with_source_retrieval(input_question: str, query_image_b64: Option
                 "image_b64": metadata.get("content_b64") if metadata.get("type") == "image" else None
             })
     print(f"Chain finished. Returning answer and {len(final_sources)} cited sources.")
-    
-    return {
+
+    result = {
         "answer": generated_answer,
         "sources": final_sources
     }
+    # Refusals reflect what the corpus lacked at this moment; caching them
+    # would keep serving "I cannot answer" after the missing document arrives.
+    if not _looks_like_refusal(generated_answer):
+        qa_cache.store(search_query, result)
+    return result
+
+def _preload_models():
+    """
+    Warm the VLM and embedding models at import so the first real query does
+    not pay seconds of model-load latency. Raise OLLAMA_MAX_LOADED_MODELS /
+    OLLAMA_NUM_PARALLEL on the daemon to keep them all resident.
+    """
+    try:
+        ollama.generate(model='qwen2.5vl:7b', prompt=' ', keep_alive='24h')
+        ollama.embed(model=EMBEDDING_MODEL, input=' ', keep_alive='24h')
+        print("Ollama models preloaded and kept warm.")
+    except Exception as e:
+        print(f"WARNING: Could not preload Ollama models: {e}")
+
+_preload_models()
 
 if __name__ == '__main__':
     print("\n--- Running standalone test for the RAG chain ---")
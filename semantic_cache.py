@@ -0,0 +1,134 @@
+import json
+import os
+import shutil
+import threading
+import time
+import faiss
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+from vector_store import STORE_PATH, get_embeddings
+
+# Cache location and tuning
+QA_CACHE_PATH = os.path.join(STORE_PATH, "qa_cache")
+QA_INDEX_FILE = os.path.join(QA_CACHE_PATH, "index.faiss")
+QA_ENTRIES_FILE = os.path.join(QA_CACHE_PATH, "entries.json")
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+class SemanticQACache:
+    """
+    Embedding-keyed cache for full RAG responses. Queries whose embeddings
+    land within a cosine-similarity threshold of a previous query get the
+    stored {answer, sources} back without touching retrieval or the LLMs.
+    """
+
+    def __init__(self, similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._index: Optional[faiss.IndexHNSWFlat] = None
+        self._entries: List[Dict[str, Any]] = []
+        # Serializes index mutations against searches: request threads hit
+        # this cache concurrently and FAISS adds are not thread-safe.
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(QA_INDEX_FILE) and os.path.exists(QA_ENTRIES_FILE):
+                self._index = faiss.read_index(QA_INDEX_FILE)
+                with open(QA_ENTRIES_FILE, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+                print(f"Semantic QA cache loaded with {len(self._entries)} entries.")
+        except Exception as e:
+            print(f"Could not load semantic QA cache, starting empty. Error: {e}")
+            self._index = None
+            self._entries = []
+
+    def _persist(self):
+        try:
+            os.makedirs(QA_CACHE_PATH, exist_ok=True)
+            faiss.write_index(self._index, QA_INDEX_FILE)
+            with open(QA_ENTRIES_FILE, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+        except Exception as e:
+            print(f"WARNING: Could not persist semantic QA cache: {e}")
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(get_embeddings().embed_query(query), dtype="float32")[None, :]
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, query: str, similarity_threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached response for a semantically close query, or None.
+        """
+        if self._index is None or self._index.ntotal == 0:
+            return None
+        threshold = similarity_threshold if similarity_threshold is not None else self.similarity_threshold
+        try:
+            query_vector = self._embed(query)
+            with self._lock:
+                self._index.hnsw.efSearch = 16
+                distances, indices = self._index.search(query_vector, 1)
+                entry = self._entries[indices[0][0]] if indices[0][0] >= 0 else None
+        except Exception as e:
+            print(f"WARNING: Semantic QA cache lookup failed: {e}")
+            return None
+        if entry is None:
+            return None
+        # Vectors are L2-normalized, so squared L2 distance = 2 * (1 - cosine).
+        if distances[0][0] > (1.0 - threshold) * 2:
+            return None
+        if self.ttl_seconds and time.time() - entry.get("timestamp", 0) > self.ttl_seconds:
+            return None
+        print(f"Semantic QA cache hit for query: '{query[:50]}...'")
+        return {"answer": entry["answer"], "sources": entry["sources"]}
+
+    def store(self, query: str, response: Dict[str, Any]):
+        """
+        Insert a freshly generated response and persist the cache.
+        """
+        try:
+            query_vector = self._embed(query)
+            with self._lock:
+                if self._index is None:
+                    self._index = faiss.IndexHNSWFlat(query_vector.shape[1], 32)
+                self._index.add(query_vector)
+                self._entries.append({
+                    "query": query,
+                    "answer": response.get("answer", ""),
+                    "sources": response.get("sources", []),
+                    "timestamp": time.time(),
+                })
+                self._persist()
+        except Exception as e:
+            print(f"WARNING: Could not store entry in semantic QA cache: {e}")
+
+    def clear(self):
+        """
+        Drop every cached response, in memory and on disk. Must run whenever
+        the knowledge base changes out from under the cached answers.
+        """
+        with self._lock:
+            self._index = None
+            self._entries = []
+            if os.path.exists(QA_CACHE_PATH):
+                try:
+                    shutil.rmtree(QA_CACHE_PATH)
+                except Exception as e:
+                    print(f"WARNING: Could not delete semantic QA cache files: {e}")
+        print("Semantic QA cache cleared.")
+
+_qa_cache: Optional[SemanticQACache] = None
+
+def get_qa_cache() -> SemanticQACache:
+    """
+    Process-wide cache instance, shared so knowledge-base clears can
+    invalidate the same object the RAG chain reads from.
+    """
+    global _qa_cache
+    if _qa_cache is None:
+        _qa_cache = SemanticQACache()
+    return _qa_cache
@@ -1,61 +1,257 @@
+import asyncio
 import base64
 import io
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 import ollama
 from PIL import Image
 from typing import List, Dict, Any, Optional
-import json
+import orjson
+import pickle
+import shelve
 import shutil
+import threading
+import xxhash
 import gc
+import requests
 
-from langchain_chroma import Chroma
+import faiss
+import lmdb
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.stores import BaseStore
 from langchain_ollama import OllamaEmbeddings
-from langchain.storage import LocalFileStore
 from langchain.retrievers.multi_vector import MultiVectorRetriever
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from document_processor import process_document
 
 # Path and model configuration
 STORE_PATH = "storage"
-CHROMA_DB_PATH = os.path.join(STORE_PATH, "chroma_db")
+CHROMA_DB_PATH = os.path.join(STORE_PATH, "chroma_db")  # legacy Chroma data, removed on clear
+FAISS_INDEX_PATH = os.path.join(STORE_PATH, "faiss_index")
 DOCSTORE_PATH = os.path.join(STORE_PATH, "docstore")
+CHUNK_HASHES_PATH = os.path.join(STORE_PATH, "chunk_hashes.db")
 EMBEDDING_MODEL = "qwen3-embedding:4b"
 LLM_MODEL = "qwen2.5vl:7b"
 
+# HNSW tuning: build quality vs. query-time recall/speed
+HNSW_M = 24
+HNSW_EF_CONSTRUCTION = 128
+HNSW_EF_SEARCH = 64
+
+# Ollama batch-embedding endpoint
+OLLAMA_EMBED_URL = "http://localhost:11434/api/embed"
+EMBED_BATCH_SIZE = 32
+
+# How many VLM summary requests may be in flight at once; pair with
+# OLLAMA_NUM_PARALLEL on the daemon side to overlap model compute.
+SUMMARY_CONCURRENCY = 4
+
+IMAGE_SUMMARY_PROMPT = 'Provide a detailed description of this image. If it contains charts, graphs, or tables, extract the key information and data. Describe the main subject and any important context.'
+FORMULA_SUMMARY_PROMPT = "This image contains a mathematical or chemical formula. Transcribe it into a standard textual representation like LaTeX or a simple plain text description. For example, for an image of x squared, return 'x^2'."
+
 # Lazily loaded singletons
 _embeddings: Optional[OllamaEmbeddings] = None
-_vectorstore: Optional[Chroma] = None
-_docstore: Optional[LocalFileStore] = None
+_vectorstore: Optional[FAISS] = None
+_vectorstore_mmap = False  # True while the index is memory-mapped read-only
+_docstore: Optional["LMDBDocStore"] = None
 _retriever: Optional[MultiVectorRetriever] = None
 _text_splitter: Optional[RecursiveCharacterTextSplitter] = None
+_indexed_files: Optional[set] = None
+_chunk_hashes: Optional[set] = None
+
+# Serializes FAISS index mutations (add/train/save and the mmap->writable
+# swap) against searches: uploads and queries share the threadpool, and HNSW
+# adds are not safe to run concurrently with graph traversals. Re-entrant so
+# _persist can call the locked helpers it is composed of.
+_index_lock = threading.RLock()
+
+class BatchedOllamaEmbeddings(OllamaEmbeddings):
+    """
+    OllamaEmbeddings variant that sends whole batches to the modern
+    /api/embed endpoint, instead of one HTTP round-trip per text.
+    """
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = texts[start:start + EMBED_BATCH_SIZE]
+            response = requests.post(
+                OLLAMA_EMBED_URL,
+                json={"model": self.model, "input": batch},
+                timeout=60,
+            )
+            response.raise_for_status()
+            embeddings.extend(response.json()["embeddings"])
+        return embeddings
 
 def get_embeddings() -> OllamaEmbeddings:
     global _embeddings
     if _embeddings is None:
         print(f"Initializing embedding model: {EMBEDDING_MODEL}")
-        _embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
+        _embeddings = BatchedOllamaEmbeddings(model=EMBEDDING_MODEL)
     return _embeddings
 
-def get_docstore() -> LocalFileStore:
+class LMDBDocStore(BaseStore[str, bytes]):
+    """
+    BaseStore over a single LMDB environment. A whole ingest batch becomes
+    one write transaction instead of one file per key, and reads come
+    zero-copy out of the mmap.
+    """
+
+    def __init__(self, path: str, map_size: int = 8 << 30):
+        os.makedirs(path, exist_ok=True)
+        self._env = lmdb.open(path, map_size=map_size)
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        with self._env.begin() as txn:
+            return [txn.get(key.encode('utf-8')) for key in keys]
+
+    def mset(self, key_value_pairs: List[Any]) -> None:
+        with self._env.begin(write=True) as txn:
+            for key, value in key_value_pairs:
+                txn.put(key.encode('utf-8'), value)
+
+    def mdelete(self, keys: List[str]) -> None:
+        with self._env.begin(write=True) as txn:
+            for key in keys:
+                txn.delete(key.encode('utf-8'))
+
+    def yield_keys(self, prefix: Optional[str] = None):
+        with self._env.begin() as txn:
+            for key, _ in txn.cursor():
+                decoded = key.decode('utf-8')
+                if prefix is None or decoded.startswith(prefix):
+                    yield decoded
+
+    def close(self):
+        self._env.close()
+
+def get_docstore() -> LMDBDocStore:
     global _docstore
     if _docstore is None:
-        if not os.path.exists(DOCSTORE_PATH):
-            os.makedirs(DOCSTORE_PATH)
-        _docstore = LocalFileStore(DOCSTORE_PATH)
+        _docstore = LMDBDocStore(DOCSTORE_PATH)
     return _docstore
 
-def get_vectorstore() -> Chroma:
-    global _vectorstore
+def _load_vectorstore_mmap() -> FAISS:
+    """
+    Memory-map the persisted index read-only instead of deserializing it into
+    the heap: startup touches no vector data and pages fault in on demand.
+    FAISS.load_local offers no IO flags, so read the two files it writes
+    ourselves and rebuild the wrapper around them.
+    """
+    index = faiss.read_index(
+        os.path.join(FAISS_INDEX_PATH, "index.faiss"),
+        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+    )
+    with open(os.path.join(FAISS_INDEX_PATH, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(
+        embedding_function=get_embeddings(),
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        normalize_L2=True,
+    )
+
+def get_vectorstore() -> FAISS:
+    global _vectorstore, _vectorstore_mmap
     if _vectorstore is None:
-        print("Loading/Initializing Chroma vector store...")
-        _vectorstore = Chroma(
-            collection_name="multimodal_rag_persistent",
-            embedding_function=get_embeddings(),
-            persist_directory=CHROMA_DB_PATH
-        )
+        print("Loading/Initializing FAISS vector store...")
+        if os.path.exists(FAISS_INDEX_PATH):
+            try:
+                _vectorstore = _load_vectorstore_mmap()
+                _vectorstore_mmap = True
+            except Exception as e:
+                print(f"WARNING: mmap load failed ({e}); falling back to in-memory load.")
+                _vectorstore = FAISS.load_local(
+                    FAISS_INDEX_PATH,
+                    get_embeddings(),
+                    allow_dangerous_deserialization=True,
+                    distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+                    normalize_L2=True,
+                )
+        else:
+            dim = len(get_embeddings().embed_query("dimension probe"))
+            # 8-bit scalar quantization: 4x smaller vectors and faster,
+            # bandwidth-bound search at negligible recall cost. For corpora
+            # beyond ~1M vectors, an IVF+PQ factory index would be the next step.
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            _vectorstore = FAISS(
+                embedding_function=get_embeddings(),
+                index=index,
+                docstore=InMemoryDocstore(),
+                index_to_docstore_id={},
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+                normalize_L2=True,
+            )
+        if hasattr(_vectorstore.index, "hnsw"):
+            _vectorstore.index.hnsw.efSearch = HNSW_EF_SEARCH
     return _vectorstore
 
+def set_ef_search(ef_search: int):
+    """
+    Tune query-time HNSW effort: lower for cheap lookups, higher for cold
+    queries that need maximum recall.
+    """
+    with _index_lock:
+        index = get_vectorstore().index
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = ef_search
+
+def search_with_scores(query: str, k: int, ef_search: Optional[int] = None):
+    """
+    similarity_search_with_score under the index lock, so a concurrent
+    ingest cannot mutate the HNSW graph mid-traversal. efSearch is a global
+    on the shared index, so callers that want a specific effort level pass
+    it here and the set+search pair happens atomically.
+    """
+    with _index_lock:
+        if ef_search is not None:
+            set_ef_search(ef_search)
+        return get_vectorstore().similarity_search_with_score(query, k=k)
+
+def _ensure_writable_index():
+    """
+    A memory-mapped index is read-only; before an ingest mutates it, swap in
+    a regular in-memory load. Queries keep the cheap mmap path.
+    """
+    global _vectorstore, _vectorstore_mmap, _retriever
+    with _index_lock:
+        if _vectorstore_mmap:
+            print("Promoting mmap'd FAISS index to a writable in-memory copy for ingest...")
+            _vectorstore = FAISS.load_local(
+                FAISS_INDEX_PATH,
+                get_embeddings(),
+                allow_dangerous_deserialization=True,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+                normalize_L2=True,
+            )
+            if hasattr(_vectorstore.index, "hnsw"):
+                _vectorstore.index.hnsw.efSearch = HNSW_EF_SEARCH
+            _vectorstore_mmap = False
+            _retriever = None  # rebuilt lazily around the new store
+
+def save_vectorstore():
+    with _index_lock:
+        get_vectorstore().save_local(FAISS_INDEX_PATH)
+
+def _ensure_index_trained(embeddings: List[List[float]]):
+    """
+    The scalar quantizer must learn its value ranges before vectors can be
+    added; train it on the first batch (normalized, as at add time).
+    """
+    index = get_vectorstore().index
+    if hasattr(index, "is_trained") and not index.is_trained:
+        train_matrix = np.asarray(embeddings, dtype="float32")
+        faiss.normalize_L2(train_matrix)
+        index.train(train_matrix)
+
 def get_text_splitter() -> RecursiveCharacterTextSplitter:
     global _text_splitter
     if _text_splitter is None:
@@ -72,10 +268,24 @@ def get_retriever() -> MultiVectorRetriever:
         )
     return _retriever
 
+# libjpeg-turbo encoder; fall back to Pillow when PyTurboJPEG (or the
+# native library) is not installed.
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbojpeg = TurboJPEG()
+except Exception:
+    _turbojpeg = None
+
 def image_to_base64(pil_image: Image.Image) -> str:
-    buffered = io.BytesIO()
-    pil_image.convert("RGB").save(buffered, format="JPEG")
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    rgb_image = pil_image.convert("RGB")
+    if _turbojpeg is not None:
+        jpeg_bytes = _turbojpeg.encode(np.asarray(rgb_image), quality=85, pixel_format=TJPF_RGB)
+    else:
+        buffered = io.BytesIO()
+        # optimize=False skips Pillow's second Huffman pass
+        rgb_image.save(buffered, format="JPEG", quality=85, optimize=False)
+        jpeg_bytes = buffered.getvalue()
+    return base64.b64encode(jpeg_bytes).decode('utf-8')
 
 def generate_image_summary(image_b64: str) -> str:
     print("Generating summary for an image...")
@@ -84,7 +294,7 @@ def generate_image_summary(image_b64: str) -> str:
             model='qwen2.5vl:7b',
             messages=[{
                 'role': 'user',
-                'content': 'Provide a detailed description of this image. If it contains charts, graphs, or tables, extract the key information and data. Describe the main subject and any important context.',
+                'content': IMAGE_SUMMARY_PROMPT,
                 'images': [image_b64]
             }],
             options={"temperature": 0.0}
@@ -102,7 +312,7 @@ def generate_formula_summary(image_b64: str) -> str:
             model='qwen2.5vl:7b',
             messages=[{
                 'role': 'user',
-                'content': "This image contains a mathematical or chemical formula. Transcribe it into a standard textual representation like LaTeX or a simple plain text description. For example, for an image of x squared, return 'x^2'.",
+                'content': FORMULA_SUMMARY_PROMPT,
                 'images': [image_b64]
             }],
             options={"temperature": 0.0}
@@ -111,15 +321,84 @@ def generate_formula_summary(image_b64: str) -> str:
     except Exception as e:
         return f"Error generating formula summary: {e}"
 
+async def _summarize(client: "ollama.AsyncClient", semaphore: asyncio.Semaphore,
+                     image_b64: str, kind: str) -> str:
+    prompt = FORMULA_SUMMARY_PROMPT if kind == 'image_formula' else IMAGE_SUMMARY_PROMPT
+    async with semaphore:
+        try:
+            response = await client.chat(
+                model='qwen2.5vl:7b',
+                messages=[{
+                    'role': 'user',
+                    'content': prompt,
+                    'images': [image_b64]
+                }],
+                options={"temperature": 0.0}
+            )
+            return response['message']['content']
+        except Exception as e:
+            if kind == 'image_formula':
+                return f"Error generating formula summary: {e}"
+            print(f"ERROR: Failed to generate image summary: {e}")
+            return "No summary could be generated for this image."
+
+async def _summarize_all(jobs: List[Any]) -> List[str]:
+    """
+    Fan out VLM summaries for (image_b64, kind) pairs, bounded by a semaphore
+    so the Ollama daemon is not overwhelmed.
+    """
+    client = ollama.AsyncClient()
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    return await asyncio.gather(*[_summarize(client, semaphore, image_b64, kind) for image_b64, kind in jobs])
+
+def _metadata_match_exists(key: str, value: Any) -> bool:
+    """
+    Scan the FAISS-side docstore for a chunk whose metadata matches.
+    """
+    for doc in get_vectorstore().docstore._dict.values():
+        if doc.metadata.get(key) == value:
+            return True
+    return False
+
+def document_exists_by_hash(content_hash: str) -> bool:
+    """
+    Check for a document by content digest, so renamed re-uploads are still caught.
+    """
+    if _metadata_match_exists("content_hash", content_hash):
+        print(f"A document with hash '{content_hash[:12]}...' already exists in the vector store.")
+        return True
+    return False
+
 def document_exists(filename: str) -> bool:
-    vectorstore = get_vectorstore()
-    existing_docs = vectorstore.get(where={"source": filename}, limit=1)
-    if existing_docs and existing_docs['ids']:
+    if filename in _get_indexed_files_cache():
         print(f"Document '{filename}' already exists in the vector store.")
         return True
     return False
 
-def add_to_knowledge_base(processed_data: List[Dict[str, Any]]):
+def _get_chunk_hashes() -> set:
+    """
+    64-bit content hashes of every chunk ever vectorized, so duplicated
+    passages across documents are indexed once instead of deduped per query.
+    """
+    global _chunk_hashes
+    if _chunk_hashes is None:
+        _chunk_hashes = set()
+        try:
+            with shelve.open(CHUNK_HASHES_PATH) as db:
+                _chunk_hashes = db.get("hashes", set())
+        except Exception as e:
+            print(f"WARNING: Could not load chunk hash set: {e}")
+    return _chunk_hashes
+
+def _persist_chunk_hashes():
+    try:
+        os.makedirs(STORE_PATH, exist_ok=True)
+        with shelve.open(CHUNK_HASHES_PATH) as db:
+            db["hashes"] = _get_chunk_hashes()
+    except Exception as e:
+        print(f"WARNING: Could not persist chunk hash set: {e}")
+
+def add_to_knowledge_base(processed_data: List[Dict[str, Any]], content_hash: Optional[str] = None):
     """
     Build or rebuild the vector knowledge base from processed document data.
     This function is idempotent: each call clears old data and fills with new data.
@@ -134,17 +413,44 @@ def add_to_knowledge_base(processed_data: List[Dict[str, Any]]):
         return "exists"
     print(f"\n--- Adding content from '{source_filename}' to the knowledge base ---")
 
+    # Stage 1: CPU-bound text splitting fanned across threads.
+    text_items = [item for item in processed_data if item['type'] == 'text']
+    text_chunks = _split_all(text_items)
+
+    # Stage 2: fan out the slow VLM summaries, so a 50-image PDF costs a few
+    # batches of concurrent calls instead of 50 sequential ones.
+    image_items = [item for item in processed_data if item['type'] in ('image', 'image_formula')]
+    image_summaries: Dict[int, Any] = {}
+    if image_items:
+        print(f"Summarizing {len(image_items)} images/formulas concurrently...")
+        jobs = [(image_to_base64(item['content']), item['type']) for item in image_items]
+        summaries = asyncio.run(_summarize_all(jobs))
+        image_summaries = {
+            id(item): (job[0], summary)
+            for item, job, summary in zip(image_items, jobs, summaries)
+        }
+
+    # Stage 3: assemble the docstore items and vectorization inputs.
     doc_ids = []
     docs_to_vectorize = []
     metadatas = []
     items_to_store_in_docstore = []
-    text_splitter = get_text_splitter()
+    skipped_duplicates = 0
+    new_chunk_hashes = set()
     for item in processed_data:
         unique_id = str(uuid.uuid4())
         chunk_metadata = {"source": source_filename, "page": item.get('page', 1)}
+        if content_hash:
+            chunk_metadata["content_hash"] = content_hash
         if item['type'] == 'text':
-            sub_chunks = text_splitter.split_text(item['content'])
-            for chunk in sub_chunks:
+            for chunk in text_chunks[id(item)]:
+                # Dedup at ingest: an already-indexed passage would only waste
+                # an embedding and crowd the retrieval fan-out.
+                chunk_hash = xxhash.xxh3_64_intdigest(chunk)
+                if chunk_hash in _get_chunk_hashes() or chunk_hash in new_chunk_hashes:
+                    skipped_duplicates += 1
+                    continue
+                new_chunk_hashes.add(chunk_hash)
                 chunk_id = str(uuid.uuid4())
                 chunk_metadata["doc_id"] = chunk_id
                 items_to_store_in_docstore.append((chunk_id, {"type": "text", "content": chunk}))
@@ -152,17 +458,15 @@ def add_to_knowledge_base(processed_data: List[Dict[str, Any]]):
                 docs_to_vectorize.append(chunk)
                 metadatas.append(chunk_metadata.copy())
         elif item['type'] == 'image' or item['type'] == 'image_formula':
-            image_b64 = image_to_base64(item['content'])
+            image_b64, summary = image_summaries[id(item)]
             chunk_metadata["doc_id"] = unique_id
             if item['type'] == 'image':
-                summary = generate_image_summary(image_b64)
                 items_to_store_in_docstore.append((unique_id, {
                     "type": "image",
                     "content_b64": image_b64,
                     "summary": f"Summary of an image from page {item.get('page', 1)}: {summary}"
                 }))
             else:
-                summary = generate_formula_summary(image_b64)
                 items_to_store_in_docstore.append((unique_id, {
                     "type": "image",
                     "content_b64": image_b64,
@@ -171,71 +475,141 @@ def add_to_knowledge_base(processed_data: List[Dict[str, Any]]):
             doc_ids.append(unique_id)
             docs_to_vectorize.append(summary)
             metadatas.append(chunk_metadata)
-    docstore = get_docstore()
+    if skipped_duplicates:
+        print(f"Skipped {skipped_duplicates} already-indexed chunks.")
+    # Stage 4: one batched embed call, then persist everything.
+    _persist(doc_ids, docs_to_vectorize, metadatas, items_to_store_in_docstore)
+    # Record the hashes only after the chunks are actually indexed: if
+    # _persist raises (e.g. an embed timeout), a retry of the same document
+    # must not skip chunks that never made it in.
+    _get_chunk_hashes().update(new_chunk_hashes)
+    _persist_chunk_hashes()
+    _get_indexed_files_cache().add(source_filename)
+    print("--- Knowledge base built successfully! ---")
+
+def _split_all(text_items: List[Dict[str, Any]]) -> Dict[int, List[str]]:
+    """
+    Split all text items across a thread pool, keyed by item identity.
+    """
+    if not text_items:
+        return {}
+    text_splitter = get_text_splitter()
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        chunk_lists = list(executor.map(text_splitter.split_text, [item['content'] for item in text_items]))
+    return {id(item): chunks for item, chunks in zip(text_items, chunk_lists)}
+
+def _embed_all_batched(texts: List[str]) -> List[List[float]]:
+    return get_embeddings().embed_documents(texts)
+
+def _persist(doc_ids: List[str], docs_to_vectorize: List[str],
+             metadatas: List[Dict[str, Any]], items_to_store_in_docstore: List[Any]):
+    """
+    Write the assembled chunks with one docstore mset and one vector-store add.
+    """
     if items_to_store_in_docstore:
+        # orjson serializes straight to bytes, which is what mset wants anyway
         encoded_items = [
-            (key, json.dumps(value).encode('utf-8'))
+            (key, orjson.dumps(value))
             for key, value in items_to_store_in_docstore
         ]
-        docstore.mset(encoded_items)
+        get_docstore().mset(encoded_items)
         print(f"Successfully stored {len(encoded_items)} items in the docstore.")
-    retriever = get_retriever()
     if docs_to_vectorize:
         print(f"Embedding and adding {len(docs_to_vectorize)} new chunks to the vector store...")
-        retriever.vectorstore.add_texts(texts=docs_to_vectorize, ids=doc_ids, metadatas=metadatas)
-    print("--- Knowledge base built successfully! ---")
+        # Embed before taking the lock: the Ollama round-trips are the slow
+        # part and touch no index state.
+        embeddings = _embed_all_batched(docs_to_vectorize)
+        with _index_lock:
+            _ensure_writable_index()
+            _ensure_index_trained(embeddings)
+            get_retriever().vectorstore.add_embeddings(
+                text_embeddings=list(zip(docs_to_vectorize, embeddings)),
+                metadatas=metadatas,
+                ids=doc_ids,
+            )
+            save_vectorstore()
 
 def clear_knowledge_base():
     """
-    Completely clears the knowledge base, ensuring ChromaDB connections are closed before deleting files.
+    Completely clears the knowledge base, releasing in-process handles before deleting files.
     """
-    global _vectorstore, _docstore, _retriever
+    global _vectorstore, _vectorstore_mmap, _docstore, _retriever, _indexed_files, _chunk_hashes
     print("\n--- Clearing the entire knowledge base ---")
-    client_to_reset = None
-    if _vectorstore is not None:
-        try:
-            client_to_reset = _vectorstore._client
-        except AttributeError:
-            pass
+    _indexed_files = None
     print("Releasing Python object references...")
+    if _docstore is not None:
+        try:
+            _docstore.close()  # release the LMDB mmap before deleting its files
+        except Exception as e:
+            print(f"Warning: Could not close LMDB docstore: {e}")
     _vectorstore = None
+    _vectorstore_mmap = False
     _docstore = None
     _retriever = None
     gc.collect()
-    if client_to_reset:
-        print("Resetting ChromaDB client to close connections...")
+    print("Deleting storage directories...")
+    if os.path.exists(FAISS_INDEX_PATH):
         try:
-            client_to_reset.reset()
+            shutil.rmtree(FAISS_INDEX_PATH)
+            print(f"Successfully deleted: {FAISS_INDEX_PATH}")
         except Exception as e:
-            print(f"Warning: Could not reset ChromaDB client. Deletion might fail. Error: {e}")
-    print("Deleting storage directories...")
+            print(f"ERROR deleting FAISS index directory: {e}")
     if os.path.exists(CHROMA_DB_PATH):
+        # Left behind by installs that predate the FAISS migration.
         try:
             shutil.rmtree(CHROMA_DB_PATH)
             print(f"Successfully deleted: {CHROMA_DB_PATH}")
         except Exception as e:
-            print(f"ERROR deleting ChromaDB directory: {e}")
+            print(f"ERROR deleting legacy ChromaDB directory: {e}")
     if os.path.exists(DOCSTORE_PATH):
         try:
             shutil.rmtree(DOCSTORE_PATH)
             print(f"Successfully deleted: {DOCSTORE_PATH}")
         except Exception as e:
             print(f"ERROR deleting Docstore directory: {e}")
+    # Cached answers cite documents that no longer exist; drop them too.
+    # Imported here because semantic_cache imports this module at the top.
+    try:
+        from semantic_cache import get_qa_cache
+        get_qa_cache().clear()
+    except Exception as e:
+        print(f"WARNING: Could not clear semantic QA cache: {e}")
+    _chunk_hashes = None
+    if os.path.isdir(STORE_PATH):
+        # shelve may split the hash set across suffixed files (.db, .dat, .dir)
+        for name in os.listdir(STORE_PATH):
+            if name.startswith(os.path.basename(CHUNK_HASHES_PATH)):
+                try:
+                    os.remove(os.path.join(STORE_PATH, name))
+                    print(f"Successfully deleted: {os.path.join(STORE_PATH, name)}")
+                except Exception as e:
+                    print(f"ERROR deleting chunk hash file: {e}")
     print("--- Knowledge base cleared successfully! ---")
 
+def _get_indexed_files_cache() -> set:
+    """
+    Lazily load the set of indexed source filenames. The sidebar polls the
+    file list on every rerun, so keep it in memory and update it on writes
+    instead of scanning the docstore metadata each time.
+    """
+    global _indexed_files
+    if _indexed_files is None:
+        try:
+            _indexed_files = {
+                doc.metadata['source']
+                for doc in get_vectorstore().docstore._dict.values()
+                if doc.metadata and 'source' in doc.metadata
+            }
+        except Exception as e:
+            print(f"Could not retrieve indexed files. Maybe the DB is empty? Error: {e}")
+            _indexed_files = set()
+    return _indexed_files
+
 def get_indexed_files() -> List[str]:
     """
     Returns a sorted list of unique source filenames from the vector store.
     """
-    try:
-        all_entries = get_vectorstore().get(include=["metadatas"])
-        if not all_entries or 'metadatas' not in all_entries:
-            return []
-        sources = {meta['source'] for meta in all_entries['metadatas'] if meta and 'source' in meta}
-        return sorted(list(sources))
-    except Exception as e:
-        print(f"Could not retrieve indexed files. Maybe the DB is empty? Error: {e}")
-        return []
+    return sorted(_get_indexed_files_cache())
 
 if __name__ == '__main__':
     print("--- RUNNING FINAL TEST SCRIPT ---")